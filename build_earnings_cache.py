@@ -7,6 +7,14 @@ Robust builder for earnings_cache.json used by the T2D Earnings Calendar.
 Behavior:
 - Reads tickers from eps_calendar_universe.csv
 - Calls AlphaVantage EARNINGS_CALENDAR ONCE (datatype=csv)
+    * Raw response is cached in .cache/ for a few hours, so re-runs
+      reuse it instead of hitting the API again. This is local-only:
+      the GitHub Actions job starts from a fresh checkout with no
+      .cache/, so it always fetches.
+- If the response, universe, builder code and thresholds hash the same
+  as the last successful run, and earnings_cache.json is still the file
+  that run wrote, stops early and leaves it as-is (local-only, like the
+  response cache)
 - Validates the response hard:
     * Must have expected columns
     * Must have enough raw rows
@@ -19,17 +27,36 @@ Behavior:
     * DOES NOT touch existing earnings_cache.json
 
 Result: front-end always sees last known-good JSON snapshot.
+
+Fetching, parsing and universe filtering live in earnings_pipeline.py.
 """
 
-import csv
-import io
+import hashlib
 import json
 import os
+import shutil
 import sys
 from datetime import datetime
-from typing import List, Dict
+from typing import Dict, List
+
+import earnings_pipeline
+import file_cache
+from earnings_pipeline import (
+    HORIZON,
+    fetch_earnings_calendar_from_api,
+    load_universe,
+    read_filtered_calendar,
+)
+
+try:
+    import orjson
+except ImportError:  # stdlib fallback keeps the script portable
+    orjson = None
 
-import requests
+try:
+    import zstandard
+except ImportError:  # only needed when COMPRESS=1
+    zstandard = None
 
 # ---------- CONFIG ----------
 
@@ -37,26 +64,34 @@ UNIVERSE_CSV = "eps_calendar_universe.csv"
 CACHE_JSON = "earnings_cache.json"
 ARCHIVE_DIR = "earnings_history"
 
-HORIZON = "3month"  # 3month | 6month | 12month
+# COMPRESS=1 writes archived cache snapshots as .json.zst (zstd level 3).
+# Needs the optional zstandard package (pip install zstandard), which is
+# not in requirements.txt; without it archives are written uncompressed.
+COMPRESS_ARCHIVES = os.environ.get("COMPRESS") == "1"
+ARCHIVE_ZSTD_LEVEL = 3
 
 # AlphaVantage API key from environment
 ALPHAVANTAGE_API_KEY = os.environ.get("ALPHAVANTAGE_API_KEY")
 
-ALPHA_URL_TEMPLATE = (
-    "https://www.alphavantage.co/query"
-    "?function=EARNINGS_CALENDAR"
-    "&horizon={horizon}"
-    "&apikey={api_key}"
-    "&datatype=csv"
-)
-
 # Sanity thresholds (tune if you want)
 MIN_RAW_ROWS = 100        # if we get less than this from AV, assume it's junk
 MIN_FILTERED_ROWS = 10    # if < this in your universe, refuse to overwrite cache
 
+# Input fingerprint + output digest of the last successful write
+LAST_FINGERPRINT_KEY = "last_av_hash"
+
 
 # ---------- HELPERS ----------
 
+def dump_json_bytes(obj) -> bytes:
+    """
+    Serialize obj to UTF-8 JSON bytes, using orjson when available.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+
 def require_api_key() -> str:
     if not ALPHAVANTAGE_API_KEY:
         print(
@@ -68,139 +103,86 @@ def require_api_key() -> str:
     return ALPHAVANTAGE_API_KEY
 
 
-def load_universe(path: str) -> List[str]:
+def file_digest(*paths: str, extra: bytes = b"") -> str:
     """
-    Load ticker universe from eps_calendar_universe.csv.
-    Tries to detect 'ticker' column; otherwise uses first column.
+    BLAKE2b digest over the contents of the given files, in order,
+    followed by extra.
     """
-    if not os.path.exists(path):
-        raise FileNotFoundError(f"Universe file not found: {path}")
-
-    with open(path, "r", encoding="utf-8") as f:
-        reader = csv.reader(f)
-        rows = list(reader)
-
-    if not rows:
-        raise RuntimeError("Universe CSV is empty")
+    h = hashlib.blake2b(digest_size=16)
+    for path in paths:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(64 * 1024), b""):
+                h.update(chunk)
+    h.update(extra)
+    return h.hexdigest()
 
-    header = [c.strip().lower() for c in rows[0]]
-    if "ticker" in header:
-        ticker_idx = header.index("ticker")
-        start = 1
-    else:
-        ticker_idx = 0
-        start = 0
-
-    tickers = set()
-    for row in rows[start:]:
-        if not row:
-            continue
-        t = (row[ticker_idx] or "").strip().upper()
-        if not t or t in ("TICKER", "..."):
-            continue
-        tickers.add(t)
-
-    if not tickers:
-        raise RuntimeError("No tickers found in universe CSV")
 
-    return sorted(tickers)
-
-
-def fetch_earnings_calendar_from_api(api_key: str) -> List[Dict[str, str]]:
+def input_fingerprint(response_path: str) -> str:
     """
-    Call AlphaVantage EARNINGS_CALENDAR once and return rows as dicts.
-
-    If the response looks like rate-limit / error / wrong shape,
-    raise an error instead of returning junk.
+    Fingerprint everything that determines earnings_cache.json: the raw
+    response, the universe, the code that parses / validates / writes it,
+    and the thresholds.
     """
-    url = ALPHA_URL_TEMPLATE.format(api_key=api_key, horizon=HORIZON)
-    print(f"Requesting EARNINGS_CALENDAR (horizon={HORIZON}) from AlphaVantage…")
-    resp = requests.get(url, timeout=30)
-    resp.raise_for_status()
+    config = f"{HORIZON}|{MIN_RAW_ROWS}|{MIN_FILTERED_ROWS}".encode("utf-8")
+    return file_digest(
+        response_path,
+        UNIVERSE_CSV,
+        earnings_pipeline.__file__,
+        __file__,
+        extra=config,
+    )
 
-    text = resp.text.strip()
-    if not text:
-        raise RuntimeError("Empty response from provider.")
 
-    # If they send JSON, it's a Note / Error, not real CSV.
-    if text.startswith("{"):
-        try:
-            obj = json.loads(text)
-        except Exception:
-            raise RuntimeError("Provider returned JSON that could not be parsed.")
-        msg = obj.get("Note") or obj.get("Error Message") or obj.get("Information") or text
-        raise RuntimeError(f"Provider error: {msg}")
+def inputs_unchanged(fingerprint: str) -> bool:
+    """
+    True if fingerprint matches the last successful run and
+    earnings_cache.json is still exactly the file that run wrote.
+    """
+    path = file_cache.cache_path(LAST_FINGERPRINT_KEY)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            stored = f.read().split()
+        if len(stored) != 2 or stored[0] != fingerprint:
+            return False
+        return file_digest(CACHE_JSON) == stored[1]
+    except OSError:
+        return False
 
-    # Parse CSV
-    buffer = io.StringIO(text)
-    reader = csv.DictReader(buffer)
-    rows = list(reader)
 
-    headers = [h.strip().lower() for h in (reader.fieldnames or [])]
-    if "symbol" not in headers or "reportdate" not in headers:
-        raise RuntimeError(
-            "Provider CSV missing expected 'symbol'/'reportDate' columns. "
-            "Response may be an error or format change."
-        )
-
-    if len(rows) < MIN_RAW_ROWS:
-        raise RuntimeError(
-            f"Provider returned too few rows ({len(rows)} < {MIN_RAW_ROWS}). "
-            "Likely rate limit / partial data. Refusing to update cache."
-        )
+def record_fingerprint(fingerprint: str):
+    """
+    Remember this run's input fingerprint and the digest of what it wrote.
 
-    print(f"Loaded {len(rows)} raw rows from provider.")
-    return rows
+    Best-effort: the cache is already written, so a failure here only
+    costs the skip on the next run and is reported, never raised.
+    """
+    try:
+        state = f"{fingerprint}\n{file_digest(CACHE_JSON)}\n"
+        file_cache.put(LAST_FINGERPRINT_KEY, state.encode("utf-8"))
+    except OSError as e:
+        print(f"Warning: could not record input fingerprint ({e}); next run will rebuild.")
 
 
-def build_filtered_rows(universe: List[str], raw_rows: List[Dict[str, str]]) -> List[Dict]:
+def discard_cached_response(response_path: str):
     """
-    Filter provider rows down to your universe and normalize fields.
+    Drop a cached provider response that failed parsing or sanity checks.
+    Best-effort: a failure here is reported, never raised.
     """
-    universe_set = set(universe)
-
-    print(f"Filtering into T2D universe ({len(universe)} tickers)…")
-    filtered: List[Dict] = []
-
-    for r in raw_rows:
-        symbol = (r.get("symbol") or "").strip().upper()
-        if not symbol:
-            continue
-        if symbol not in universe_set:
-            continue
-
-        report_date = (r.get("reportDate") or "").strip()
-        if not report_date:
-            continue
-
-        name = (r.get("name") or "").strip()
-        fiscal = (r.get("fiscalDateEnding") or "").strip()
-        estimate = (r.get("estimate") or "").strip()
-        currency = (r.get("currency") or "").strip()
-
-        filtered.append(
-            {
-                "symbol": symbol,
-                "name": name,
-                "reportDate": report_date,
-                "fiscalDateEnding": fiscal,
-                "estimate": estimate if estimate != "" else None,
-                "currency": currency,
-            }
-        )
-
-    print(f"Filtered down to {len(filtered)} rows in your universe.")
-    return filtered
+    try:
+        file_cache.discard(os.path.basename(response_path))
+    except OSError as e:
+        print(f"Could not discard cached response {response_path}: {e}")
 
 
-def verify_sanity(raw_rows: List[Dict], filtered_rows: List[Dict]):
+def verify_sanity(raw_count: int, filtered_rows: List[Dict]):
     """
     Decide if the data looks sane enough to overwrite the cache.
     Raise RuntimeError if not.
     """
-    if len(raw_rows) < MIN_RAW_ROWS:
+    if raw_count < MIN_RAW_ROWS:
         raise RuntimeError(
-            f"Sanity check failed: raw rows {len(raw_rows)} < {MIN_RAW_ROWS}."
+            f"Sanity check failed: raw rows {raw_count} < {MIN_RAW_ROWS}. "
+            "Likely rate limit / partial data. Refusing to update cache."
         )
     if len(filtered_rows) < MIN_FILTERED_ROWS:
         raise RuntimeError(
@@ -213,29 +195,32 @@ def archive_previous_cache(current_path: str):
     """
     If an existing earnings_cache.json is present, copy it into
     earnings_history/earnings_cache_<timestamp>.json before overwriting.
+    With COMPRESS=1 the copy is zstd-compressed to .json.zst instead.
     """
     if not os.path.exists(current_path):
         return
 
     os.makedirs(ARCHIVE_DIR, exist_ok=True)
 
-    try:
-        with open(current_path, "r", encoding="utf-8") as f:
-            old_data = json.load(f)
-    except Exception:
-        with open(current_path, "r", encoding="utf-8") as f:
-            old_text = f.read()
-        old_data = old_text
-
     stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
     archive_name = f"earnings_cache_{stamp}.json"
     archive_path = os.path.join(ARCHIVE_DIR, archive_name)
 
-    with open(archive_path, "w", encoding="utf-8") as af:
-        if isinstance(old_data, (dict, list)):
-            json.dump(old_data, af, ensure_ascii=False)
-        else:
-            af.write(str(old_data))
+    if COMPRESS_ARCHIVES and zstandard is None:
+        print("COMPRESS=1 but zstandard is not installed; archiving uncompressed.")
+
+    if COMPRESS_ARCHIVES and zstandard is not None:
+        archive_path += ".zst"
+        cctx = zstandard.ZstdCompressor(level=ARCHIVE_ZSTD_LEVEL)
+        with open(current_path, "rb") as src, open(archive_path, "wb") as dst:
+            cctx.copy_stream(src, dst)
+    else:
+        # The new cache replaces current_path with a fresh file, so a hard
+        # link is enough to keep the old bytes.
+        try:
+            os.link(current_path, archive_path)
+        except OSError:
+            shutil.copyfile(current_path, archive_path)
 
     print(f"Archived previous cache to {archive_path}")
 
@@ -243,11 +228,21 @@ def archive_previous_cache(current_path: str):
 def write_cache_json(rows: List[Dict], path: str):
     """
     Archive previous cache (if any), then write new earnings_cache.json.
+
+    The JSON goes to a temp file first and is moved into place with
+    os.replace, so readers never see a half-written cache.
     """
     archive_previous_cache(path)
 
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(rows, f, ensure_ascii=False)
+    tmp_path = path + ".tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(dump_json_bytes(rows))
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
     print(f"Wrote {len(rows)} rows to {path}")
 
 
@@ -265,21 +260,32 @@ def main():
     try:
         # 1) Load universe
         print("Loading universe…")
-        universe = load_universe(UNIVERSE_CSV)
-        print(f"Loaded universe of {len(universe)} tickers.")
+        universe_set = load_universe(UNIVERSE_CSV)
+        print(f"Loaded universe of {len(universe_set)} tickers.")
 
         # 2) Fetch calendar once
         print("Fetching earnings calendar…")
-        raw_rows = fetch_earnings_calendar_from_api(api_key)
+        response_path = fetch_earnings_calendar_from_api(api_key)
 
-        # 3) Filter + normalize
-        filtered_rows = build_filtered_rows(universe, raw_rows)
+        fingerprint = input_fingerprint(response_path)
+        if inputs_unchanged(fingerprint):
+            print("\nInputs and earnings_cache.json unchanged since last run; nothing to do.")
+            return
 
-        # 4) Sanity check before touching cache
-        verify_sanity(raw_rows, filtered_rows)
+        try:
+            # 3) Filter + normalize
+            raw_count, filtered_rows = read_filtered_calendar(response_path, universe_set)
+
+            # 4) Sanity check before touching cache
+            verify_sanity(raw_count, filtered_rows)
+        except Exception:
+            # Don't let a rejected provider response be reused on the next run.
+            discard_cached_response(response_path)
+            raise
 
         # 5) Archive previous + write JSON cache
         write_cache_json(filtered_rows, CACHE_JSON)
+        record_fingerprint(fingerprint)
 
         print("\nDone. New cache written successfully.")
 
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+earnings_pipeline.py
+
+Provider side of the T2D earnings_cache.json builder: fetch, parse and
+filter the AlphaVantage calendar. build_earnings_cache.py owns validation
+and everything that writes to the repo.
+
+Behavior:
+- Loads the ticker universe from a CSV
+- Calls AlphaVantage EARNINGS_CALENDAR (datatype=csv) at most once per
+  cache TTL, streaming the raw response into .cache/
+- Parses the raw CSV lazily and filters it to the universe in one pass
+
+Callers own validation thresholds and output; nothing here writes JSON.
+"""
+
+import csv
+import itertools
+import json
+import os
+from datetime import datetime
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import file_cache
+
+# ---------- CONFIG ----------
+
+HORIZON = "3month"  # 3month | 6month | 12month
+
+ALPHA_URL_TEMPLATE = (
+    "https://www.alphavantage.co/query"
+    "?function=EARNINGS_CALENDAR"
+    "&horizon={horizon}"
+    "&apikey={api_key}"
+    "&datatype=csv"
+)
+
+# Raw provider responses are kept in .cache/ and reused on re-runs
+RESPONSE_CACHE_TTL_SECONDS = 6 * 60 * 60
+
+
+# ---------- HELPERS ----------
+
+def make_http_session() -> requests.Session:
+    """
+    Build a keep-alive session that retries transient provider errors.
+    """
+    session = requests.Session()
+    retry = Retry(
+        total=3,
+        backoff_factor=0.5,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=("GET",),
+    )
+    session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=4, max_retries=retry))
+    return session
+
+
+_session = make_http_session()
+
+
+def load_universe(path: str) -> FrozenSet[str]:
+    """
+    Load ticker universe from eps_calendar_universe.csv.
+    Tries to detect 'ticker' column; otherwise uses first column.
+
+    Returns a frozenset, which is what the row filter tests membership
+    against; sort at the point of use if ordered output is needed.
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Universe file not found: {path}")
+
+    tickers = set()
+    with open(path, "r", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        first = next(reader, None)
+        if first is None:
+            raise RuntimeError("Universe CSV is empty")
+
+        header = [c.strip().lower() for c in first]
+        if "ticker" in header:
+            ticker_idx = header.index("ticker")
+            seed = []
+        else:
+            ticker_idx = 0
+            seed = [first]
+
+        for row in itertools.chain(seed, reader):
+            if not row:
+                continue
+            t = (row[ticker_idx] or "").strip().upper()
+            if not t or t in ("TICKER", "..."):
+                continue
+            tickers.add(t)
+
+    if not tickers:
+        raise RuntimeError("No tickers found in universe CSV")
+
+    return frozenset(tickers)
+
+
+def response_cache_key() -> str:
+    """
+    Cache key for today's raw EARNINGS_CALENDAR response.
+    """
+    return f"alphavantage_{HORIZON}_{datetime.utcnow():%Y%m%d}.csv"
+
+
+def fetch_earnings_calendar_from_api(api_key: str) -> str:
+    """
+    Call AlphaVantage EARNINGS_CALENDAR once and return the path of the
+    raw CSV response on disk.
+
+    The response is streamed to .cache/ and reused for
+    RESPONSE_CACHE_TTL_SECONDS, so re-runs skip the network entirely.
+    """
+    cache_key = response_cache_key()
+    path = file_cache.get(cache_key, RESPONSE_CACHE_TTL_SECONDS)
+    if path:
+        print(f"Using cached EARNINGS_CALENDAR response ({path}).")
+    else:
+        url = ALPHA_URL_TEMPLATE.format(api_key=api_key, horizon=HORIZON)
+        print(f"Requesting EARNINGS_CALENDAR (horizon={HORIZON}) from AlphaVantage…")
+        with _session.get(url, stream=True, timeout=30) as resp:
+            resp.raise_for_status()
+            path = file_cache.put_stream(cache_key, resp.iter_content(chunk_size=64 * 1024))
+
+    return path
+
+
+def _cell(row: List[str], idx: Optional[int]) -> str:
+    if idx is None or idx >= len(row):
+        return ""
+    return row[idx].strip()
+
+
+def read_filtered_calendar(
+    path: str, universe_set: FrozenSet[str]
+) -> Tuple[int, List[Dict]]:
+    """
+    Parse a raw EARNINGS_CALENDAR response and return
+    (raw_row_count, filtered_rows) for universe_set.
+
+    Parsing and filtering are one pass over the file: rows outside the
+    universe are counted and dropped as they are read, and the output dict
+    is only built for rows that are kept. If the response looks like
+    rate-limit / error / wrong shape, raise an error instead of returning
+    junk.
+    """
+    with open(path, "r", encoding="utf-8-sig", newline="") as stream:
+        first_line = stream.readline()
+        while first_line and not first_line.strip():
+            first_line = stream.readline()
+        if not first_line:
+            raise RuntimeError("Empty response from provider.")
+
+        # If they send JSON, it's a Note / Error, not real CSV.
+        if first_line.lstrip().startswith("{"):
+            text = (first_line + stream.read()).strip()
+            try:
+                obj = json.loads(text)
+            except Exception:
+                raise RuntimeError("Provider returned JSON that could not be parsed.")
+            msg = obj.get("Note") or obj.get("Error Message") or obj.get("Information") or text
+            raise RuntimeError(f"Provider error: {msg}")
+
+        reader = csv.reader(itertools.chain([first_line], stream))
+
+        headers = [h.strip().lower() for h in next(reader)]
+        if "symbol" not in headers or "reportdate" not in headers:
+            raise RuntimeError(
+                "Provider CSV missing expected 'symbol'/'reportDate' columns. "
+                "Response may be an error or format change."
+            )
+
+        columns = {h: i for i, h in enumerate(headers)}
+        i_sym = columns["symbol"]
+        i_date = columns["reportdate"]
+        i_name = columns.get("name")
+        i_fiscal = columns.get("fiscaldateending")
+        i_est = columns.get("estimate")
+        i_cur = columns.get("currency")
+
+        print(f"Filtering into T2D universe ({len(universe_set)} tickers)…")
+        raw_count = 0
+        filtered: List[Dict] = []
+
+        for row in reader:
+            if not row:
+                continue
+            raw_count += 1
+
+            # Keep decision first, on the bare symbol: AlphaVantage symbols
+            # carry no padding, and most rows are rejected here, so the
+            # remaining fields are only stripped for rows we keep.
+            if i_sym >= len(row):
+                continue
+            symbol = row[i_sym].upper()
+            if symbol not in universe_set:
+                continue
+
+            report_date = _cell(row, i_date)
+            if not report_date:
+                continue
+
+            estimate = _cell(row, i_est)
+
+            filtered.append(
+                {
+                    "symbol": symbol,
+                    "name": _cell(row, i_name),
+                    "reportDate": report_date,
+                    "fiscalDateEnding": _cell(row, i_fiscal),
+                    "estimate": estimate if estimate != "" else None,
+                    "currency": _cell(row, i_cur),
+                }
+            )
+
+    print(f"Loaded {raw_count} raw rows from provider.")
+    print(f"Filtered down to {len(filtered)} rows in your universe.")
+    return raw_count, filtered
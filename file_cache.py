@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+file_cache.py
+
+Tiny on-disk TTL cache used by the T2D earnings scripts.
+
+Behavior:
+- Entries are plain files under .cache/, addressed by a string key
+- get() returns the entry's path only if it is younger than the TTL
+- put_stream() writes chunks to a temp file, then renames it into place,
+  so a half-written download is never seen as a cache hit
+- discard() drops an entry (e.g. when its contents failed validation)
+
+Entries hold raw provider bytes, not parsed rows, so callers re-run their
+normal validation on every read.
+
+The cache only helps local re-runs; the GitHub Actions job checks out a
+fresh tree with no .cache/ and does not persist it.
+"""
+
+import os
+import time
+from typing import Iterable, Optional
+
+CACHE_DIR = ".cache"
+
+
+def cache_path(key: str) -> str:
+    return os.path.join(CACHE_DIR, key)
+
+
+def get(key: str, ttl_seconds: float) -> Optional[str]:
+    """
+    Return the path of a fresh cache entry for key, or None on miss/expiry.
+    """
+    path = cache_path(key)
+    try:
+        age = time.time() - os.path.getmtime(path)
+    except OSError:
+        return None
+    if age > ttl_seconds:
+        return None
+    return path
+
+
+def put_stream(key: str, chunks: Iterable[bytes]) -> str:
+    """
+    Write chunks to the cache entry for key atomically and return its path.
+    """
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    path = cache_path(key)
+    tmp_path = path + ".part"
+
+    try:
+        with open(tmp_path, "wb") as f:
+            for chunk in chunks:
+                if chunk:
+                    f.write(chunk)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return path
+
+
+def put(key: str, data: bytes) -> str:
+    """
+    Store data as the cache entry for key and return its path.
+    """
+    return put_stream(key, [data])
+
+
+def discard(key: str):
+    """
+    Remove the cache entry for key, if present.
+    """
+    try:
+        os.remove(cache_path(key))
+    except FileNotFoundError:
+        pass